@@ -2,7 +2,10 @@
 
 """ Scrapes the OSM wiki for italian traffic signs and outputs json to stdout."""
 
+from concurrent.futures import ThreadPoolExecutor
+import io
 import json
+import os.path
 import re
 from typing import Dict, Any
 from urllib.parse import unquote
@@ -18,82 +21,151 @@ def text(e, item, name):
         item[name] = t
 
 def flt(s):
-    return float(s.replace("mm", "").replace("px", "").replace("pt", "").strip())
+    return float(UNITS_RE.sub("", s))
 
 def get_valid_filename(name):
     s = str(name).strip().replace(" ", "_")
-    s = re.sub(r"(?u)[^-\w.]", "", s)
+    if s.isascii():
+        return s.translate(INVALID_ASCII)
+    s = INVALID_RE.sub("", s)
     return s
 
+def svg_attrib(content):
+    """Return the attributes of the root element of an SVG.
+
+    Stops parsing after the root start tag, we don't need the rest of the tree.
+    Raises ValueError if the root element is not an svg element.
+    """
+    for _, root in etree.iterparse(io.BytesIO(content), events = ("start",), collect_ids = False):
+        if root.tag != SVG_TAG:
+            raise ValueError(f"not an svg: root element is {root.tag}")
+        return dict(root.attrib)
+    raise ValueError("not an svg: no root element")
+
+def save(filename, content):
+    """Write a downloaded file in one call."""
+    with open("svgs/" + filename, "wb") as fp:
+        fp.write(content)
+
 PAGE = "https://wiki.openstreetmap.org/wiki/IT:Road_signs_in_Italy#Segnaletica_verticale_(Vertical_signs)"
 HEADERS = {'User-Agent': 'OSM Traffic Sign Bot/0.0.1 (marcello@perathoner.de)'}
-PREFIX = re.compile("^https://upload.wikimedia.org/wikipedia/commons/./../Italian_traffic_signs?_-_")
+COMMONS = "https://upload.wikimedia.org/wikipedia/commons/"
+PREFIX = re.compile("^" + re.escape(COMMONS) + "./../Italian_traffic_signs?_-_")
+SVG_RE = re.compile(r"^(.*?\.svg)")
+UNITS_RE = re.compile(r"\s*(mm|px|pt)\s*$")
+INVALID_RE = re.compile(r"(?u)[^-\w.]")
+INVALID_ASCII = str.maketrans("", "", "".join(
+    c for c in map(chr, range(128)) if INVALID_RE.match(c)
+))
+"""Deletes the same characters as INVALID_RE, faster but only for ASCII strings."""
+SVG_TAG = "{http://www.w3.org/2000/svg}svg"
 ICON_FLAG = "https://upload.wikimedia.org/wikipedia/en/0/03/Flag_of_Italy.svg"
+MAX_WORKERS = 8
+""" how many downloads to run in parallel """
+
+# compiled once, reused for every table
+ROWS_XP = etree.XPath(".//tr[td]")
+
+# one pooled keep-alive session for all requests
+SESSION = requests.Session()
+SESSION.headers.update(HEADERS)
+SESSION.mount("https://", requests.adapters.HTTPAdapter(pool_connections = 4, pool_maxsize = MAX_WORKERS))
 
-r = requests.get(PAGE, headers = HEADERS)
+r = SESSION.get(PAGE)
 root = html.fromstring(r.text)
 
+# one pass in doc order, remember the last header seen before each table
 section = None
+tables = []
+for el in root.iter("h2", "h3", "h4", "table"):
+    if el.tag != "table":
+        section = el.text_content().strip()
+    elif "wikitable" in el.get("class", ""):
+        tables.append((section, el))
+
 items = []
 
-for table in root.xpath("//table[contains(@class, 'wikitable')]"):
-    for header in table.xpath("preceding::h2|preceding::h3|preceding::h4"):
-        # get last one in doc order
-        section = header.text_content().strip()
-    for row in table.xpath(".//tr[td]"):
+for section, table in tables:
+    for row in ROWS_XP(table):
         item : Dict[str, Any] = {"section": section, "urls": [], "tags": [], "names": {}}
-        for src in row.xpath("td[1]//img/@src"):
-            if m := re.match("^(.*?\.svg)", src):
-                item["urls"].append(m.group(1).replace("thumb/", ""))
-        for td in row.xpath("td[2]"):
-            text(td, item, "id")
-        for td in row.xpath("td[3]"):
-            text(td, item, "vienna")
-        for td in row.xpath("td[4]"):
-            text(td, item["names"], "it.name")
-        for td in row.xpath("td[5]"):
-            text(td, item["names"], "name")
-        for td in row.xpath("td[6]"):
-            for a in td.xpath("a[@href]"):
-                item["wiki"] = a.get("href")
-            for tt in td.xpath("tt"):
+        # one pass over the cells instead of one XPath per column
+        tds = row.findall("td")
+        for td in tds[0:1]:
+            for img in td.iter("img"):
+                src = img.get("src")
+                if src is not None and (m := SVG_RE.match(src)):
+                    item["urls"].append(m.group(1).replace("thumb/", ""))
+        for td, d, name in zip(tds[1:5],
+                               (item, item, item["names"], item["names"]),
+                               ("id", "vienna", "it.name", "name")):
+            text(td, d, name)
+        for td in tds[5:6]:
+            for a in td.iterchildren("a"):
+                if a.get("href") is not None:
+                    item["wiki"] = a.get("href")
+            for tt in td.iterchildren("tt"):
                 item["tags"].append(tt.text_content().strip())
         items.append(item)
 
-for item in tqdm(items):
+def fetch(url):
+    """Get one icon and return the filename and size to record in its items.
+
+    Icons already in svgs/ are not downloaded again.  Delete them to force a fresh
+    download.
+    """
+    fields : Dict[str, Any] = {}
     try:
-        urls = item["urls"]
-        if len(urls) > 0:
-            url = urls[0]
-            r = requests.get(url, headers = HEADERS)
-            svg_root = etree.fromstring(r.content)
-
-            if PREFIX.match(url):
-                filename = get_valid_filename(unquote(PREFIX.sub("", url)).lower())
-                with open("svgs/" + filename, "wb") as fp:
-                    fp.write(r.content)
-                item["filename"] = filename
-            else:
-                print (f"bogus url: {url}")
-
-            width   = svg_root.get("width")
-            height  = svg_root.get("height")
-            viewBox = svg_root.get("viewBox")
-
-            if width and height:
-                item["width"] = flt(width)
-                item["height"] = flt(height)
-            elif viewBox:
-                vb = viewBox.split()
-                item["width"] = float(vb[2].strip())
-                item["height"] = float(vb[3].strip())
-    except (ValueError, etree.XMLSyntaxError) as e:
+        filename = None
+        if url.startswith(COMMONS) and PREFIX.match(url):
+            filename = get_valid_filename(unquote(PREFIX.sub("", url)).lower())
+
+        cached = filename is not None and os.path.exists("svgs/" + filename)
+        if cached:
+            with open("svgs/" + filename, "rb") as fp:
+                content = fp.read()
+        else:
+            r = SESSION.get(url)
+            r.raise_for_status()  # error pages must never end up in svgs/
+            content = r.content
+        attrib = svg_attrib(content)
+
+        if filename:
+            if not cached:
+                save(filename, content)
+            fields["filename"] = filename
+        else:
+            print (f"bogus url: {url}")
+
+        width   = attrib.get("width")
+        height  = attrib.get("height")
+        viewBox = attrib.get("viewBox")
+
+        if width and height:
+            fields["width"] = flt(width)
+            fields["height"] = flt(height)
+        elif viewBox:
+            vb = viewBox.split()
+            fields["width"] = float(vb[2].strip())
+            fields["height"] = float(vb[3].strip())
+    except (ValueError, etree.XMLSyntaxError, requests.HTTPError) as e:
         print (url, e)
+    return fields
+
+# many items share the same icon, get each one only once
+urls = list(dict.fromkeys(item["urls"][0] for item in items if item["urls"]))
+
+# the downloads are independent and bound by network latency
+with ThreadPoolExecutor(max_workers = MAX_WORKERS) as executor:
+    url2fields = dict(zip(urls, tqdm(executor.map(fetch, urls), total = len(urls))))
+
+for item in items:
+    if item["urls"]:
+        item.update(url2fields[item["urls"][0]])
 
-with open("osm-it-scrape.json", "w") as fp2:
-    json.dump(items, fp2, indent=4, ensure_ascii=False)
+# json.dump() issues one write per token, serialize first and write once
+with open("osm-it-scrape.json", "w", encoding = "utf-8") as fp2:
+    fp2.write(json.dumps(items, indent=4, ensure_ascii=False))
 
 # the italian flag
-r = requests.get(ICON_FLAG, headers = HEADERS)
-with open("svgs/flag.svg", "wb") as fp:
-    fp.write(r.content)
+r = SESSION.get(ICON_FLAG)
+save("flag.svg", r.content)
@@ -6,13 +6,19 @@ See: https://www.aci.it/i-servizi/normative/codice-della-strada/titolo-ii-della-
 """
 import itertools
 import json
+from operator import itemgetter
 import re
 import sys
-from typing import List, Dict
+from typing import List, Dict, Tuple
 
 from lxml import etree
 from lxml.builder import E
 
+# ElementMaker builds a new factory on every attribute access, bind them once
+COMBO, GROUP, ITEM, KEY, LINK, REFERENCE, TEXT = (
+    E.combo, E.group, E.item, E.key, E.link, E.reference, E.text
+)
+
 VERSION = "0.0.1"
 
 NAME = {
@@ -46,6 +52,12 @@ THUMBS = [
 ]
 """The icons to use to represent their groups."""
 
+SECTION_RE = re.compile(r"^(.*?)\s+\((.*?)\)$")
+"""Splits a section title into the italian and the english name."""
+
+NOSAVE_RE = re.compile(r"\{nosave:(\w+)\}")
+"""Finds the keys of the value templates that need an extra text field."""
+
 TAGS : Dict[str,str|List[str]] = {
     # "II.0"   : "traffic_sign={id} hazard=road_works",
     "II.1"   : "traffic_sign={id} hazard=damaged_road", # "unapproved"
@@ -161,84 +173,95 @@ TAGS : Dict[str,str|List[str]] = {
 }
 """Override tags for these items."""
 
-def tags(e, id_, tags_: str | List[str]):
+def parse_tags(tags_: str | List[str]) -> List[Tuple[str, List[str]]]:
+    """Split tags into keys and values and group the values on the key.
+
+    Escaped braces are unescaped.  The {id} placeholder is kept for tags() to fill in.
+    """
+    tags : List[str] = tags_.split() if isinstance(tags_, str) else tags_
+
+    pairs = [tag.split("=", 1) for tag in tags]
+    return [
+        (key, [v.format(id = "{id}") if "{" in v else v for _, v in g])
+        for key, g in itertools.groupby(pairs, lambda pair: pair[0])
+    ]
+
+
+TAGS_PARSED = { id_ : parse_tags(tags_) for id_, tags_ in TAGS.items() }
+"""TAGS, parsed once at startup."""
+
+def tags(e, id_, parsed: List[Tuple[str, List[str]]]):
     """Add a key.
 
     - if the tag value is given, just add it
     - if the tag value is '*' display a text box,
     - if a key is given more than once, display a combobox containing the different values.
     """
-    tags : List[str] = tags_.split() if isinstance(tags_, str) else tags_
-
-    # group on the key in the tag
-    for key, g in itertools.groupby(tags, lambda tag: tag.split("=")[0]):
-        try:
-            gtags = [t.format(id = COUNTRY_PREFIX + id_) for t in g]
-            if len(gtags) > 1:
-                # make a combobox for the values
-                e.append(
-                    E.combo(
-                        text=key.capitalize(),
-                        key=key,
-                        values=",".join([t.split("=")[1] for t in gtags]),
-                    )
+    full_id = COUNTRY_PREFIX + id_
+
+    for key, values in parsed:
+        values = [v.replace("{id}", full_id) for v in values]
+        if len(values) > 1:
+            # make a combobox for the values
+            e.append(
+                COMBO(
+                    text=key.capitalize(),
+                    key=key,
+                    values=",".join(values),
                 )
-                continue
-            value = gtags[0].split("=")[1]
-            if value == "*":
-                # make a textfield for the value
-                e.append(E.text(text=key.capitalize(), key=key))
-                continue
-
-            if "{" in value:
-                for k in re.findall(r"\{nosave:(\w+)\}", value):
-                    e.append(E.text(text=k.capitalize(), key="nosave:" + k))
-
-            # add a fixed value
-            params = { "key" : key, "append_with" : ";", "append_regex_search" : "^" + COUNTRY_PREFIX }
-            if "{" in value:
-                params["value_template"] = value
-            else:
-                params["value"] = value
-            if key == "traffic_sign" and value.startswith(COUNTRY_PREFIX + "M"):
-                params["append_with"] = ","
-            e.append(E.key(**params))
-        except IndexError:
-            print(id_, gtags)
-            sys.exit()
+            )
+            continue
+        value = values[0]
+        if value == "*":
+            # make a textfield for the value
+            e.append(TEXT(text=key.capitalize(), key=key))
+            continue
+
+        if "{" in value:
+            for k in NOSAVE_RE.findall(value):
+                e.append(TEXT(text=k.capitalize(), key="nosave:" + k))
+
+        # add a fixed value
+        params = { "key" : key, "append_with" : ";", "append_regex_search" : "^" + COUNTRY_PREFIX }
+        if "{" in value:
+            params["value_template"] = value
+        else:
+            params["value"] = value
+        if key == "traffic_sign" and value.startswith(COUNTRY_PREFIX + "M"):
+            params["append_with"] = ","
+        e.append(KEY(**params))
 
 
 items = json.load(sys.stdin)
 groups = []
 
-for section, group in itertools.groupby(items, lambda s: s.get("section", "unknown")):
-    g = E.group(
+for item in items:
+    item.setdefault("section", "unknown")
+
+for section, group in itertools.groupby(items, itemgetter("section")):
+    g = GROUP(
         icon_size="48",
     )
-    if m := re.match(r"^(.*?)\s+\((.*?)\)$", section):
+    if m := SECTION_RE.match(section):
         g.attrib["it.name"] = m.group(1)
         g.attrib["name"] = m.group(2)
     else:
         g.attrib["it.name"] = section
 
     for item in group:
-        if "id" not in item:
-            continue
-        if len(item["urls"]) == 0:
-            continue
-
+        id_ = item.get("id")
         url = item.get("filename")
-        if url is None:
+        if id_ is None or url is None or len(item["urls"]) == 0:
             continue
 
-        id_ = item["id"].strip().replace("/", "")
+        id_ = id_.strip().replace("/", "")
 
         # urllib.parse.unquote(item["urls"][0])
         # url = PREFIX.sub("", url)
         if id_ in THUMBS:
             g.attrib["icon"] = url
 
-        e = E.item(
+        e = ITEM(
             name=id_,
             icon=url,
             type="node",
@@ -248,12 +271,20 @@ for section, group in itertools.groupby(items, lambda s: s.get("section", "unkno
             key = key.replace("name", "tooltip")
             e.attrib[key] = value
 
-        if "wiki" in item:
-            e.append(E.link(wiki=item["wiki"].replace("/wiki/", "")))
-
-        item["tags"].append("traffic_sign={id}")
-        tags(e, id_, TAGS.get(id_, item["tags"]))  # tags in TAGS override tags in wiki
-        e.append(E.reference(ref="t"))
+        wiki = item.get("wiki")
+        if wiki is not None:
+            e.append(LINK(wiki=wiki.removeprefix("/wiki/")))
+
+        parsed = TAGS_PARSED.get(id_)  # tags in TAGS override tags in wiki
+        if parsed is None:
+            wiki_tags = item["tags"] + ["traffic_sign={id}"]
+            try:
+                parsed = parse_tags(wiki_tags)
+            except (IndexError, ValueError):
+                print(id_, wiki_tags)
+                sys.exit()
+        tags(e, id_, parsed)
+        e.append(REFERENCE(ref="t"))
 
         g.append(e)
 
@@ -286,4 +317,5 @@ preset = E.presets(
     icon=ICON,
 )
 
-print(etree.tostring(preset, encoding="unicode", method="xml", pretty_print=True))
+# stream the bytes straight to stdout instead of building one big string
+etree.ElementTree(preset).write(sys.stdout.buffer, encoding="utf-8", method="xml", pretty_print=True)
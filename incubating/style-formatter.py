@@ -5,8 +5,13 @@
 See: https://www.aci.it/i-servizi/normative/codice-della-strada/titolo-ii-della-costruzione-e-tutela-delle-strade/art-39-segnali-verticali/regolamento-art-39.html
 """
 
-import json
 import sys
+from typing import Dict, List
+
+try:
+    from orjson import loads
+except ImportError:
+    from json import loads
 
 NAME = "Traffic Signs in Italy"
 IT_NAME = "Segnaletica stradale in Italia",
@@ -21,52 +26,7 @@ ICON = "svgs/flag.svg"
 MAX_SIGNS = 5
 """ how many signs max. on one pole """
 
-items = json.load(sys.stdin)
-
-print( "meta {")
-print(f'  title: "{NAME}";')
-print(f'  description: "{DESCRIPTION}";')
-print(f'  version: "{VERSION}";')
-print(f'  author: "{AUTHOR}";')
-print(f'  icon: "{ICON}";')
-print( '  link: "https://github.com/FIXME";')
-print( "  watch-modified: true;")
-print( "}\n")
-
-id2url = {}
-id2aspect = {}
-for item in items:
-    if "id" not in item:
-        continue
-    if len(item["urls"]) == 0:
-        continue
-    id_ = item["id"]
-    url = item["urls"][0]
-    filename = item.get("filename")
-    if filename:
-        id2url[id_] = "svgs/" + filename # url
-        id2aspect[id_] = min(item.get("height", 1.0) / item.get("width", 1.0), 1.0)
-
-# substitute empty signs for those signs that support custom text
-id2url["II.50"]   = "maxspeed-empty.svg"
-id2url["II.71"]   = "maxspeed-end-empty.svg"
-id2url["II.323a"] = "zone-maxspeed-empty.svg"
-id2url["MII.1"]   = "distance-empty.svg"
-id2url["MII.2"]   = "length-empty.svg"
-id2url["MII.3"]   = "distance-empty.svg"
-
-# meta[lang="it"] {}
-
-quoted = ",\n".join([f'"{k}", "{v}"' for k, v in id2url.items()])
-aspects = ",\n".join([f'"{k}", {v:.2}' for k, v in id2aspect.items()])
-print(f"""
-globals {{
-    urls: map_build(\n{quoted}\n);
-    aspects: map_build(\n{aspects}\n)
-}}
-""")
-
-print("""
+MAPCSS_HEAD = """
 setting::icon_size {
     type: double;
     label: tr("Set the icon size...");
@@ -152,16 +112,10 @@ node.sign {
 
     text: none
 }
-""")
-
-for layer in ("noward", "forward", "backward"):
-    transform = "prop(transformprop, default)"
-    if layer == "backward":
-        transform = "transform(rotate(0.5turn), prop(transformprop, default))"
+"""
+""" Static rules before the per-layer rules: settings and node selection """
 
-    prev_layer = -1
-    for idx in range(MAX_SIGNS):
-        print (f"""
+LAYER_RULE = """
 node[prop(sign-{layer}, default)][map_get(get(prop(codes-{layer}, default), {idx}), "country") = "IT"]::{layer}{idx} {{
 
     icon-transform: {transform};
@@ -176,21 +130,16 @@ node[prop(sign-{layer}, default)][map_get(get(prop(codes-{layer}, default), {idx
     real-height: eval(setting("icon_size") * map_get(prop(aspects, globals), prop(traffic-sign-id), 1.0));
 
     font-size: eval(prop(real-height) * 0.75);
-    """)
-        if (idx == 0):
-            print(f"""
-    yoffsetprop-{layer}: prop(real-height);
-            """)
-        if idx > 0:
-            print(f"""
-    yoffsetprop-{layer}: prop(yoffsetprop-{layer}, {layer}{idx - 1}) + prop(real-height);
-            """)
-        print(f"""
+
+    yoffsetprop-{layer}: {yoffset};
+
     icon-offset-y: prop(yoffsetprop-{layer}) - prop(real-height) * 0.5;
-            """)
-        print("}\n\n")
+}}
+
+""".format
+""" The rule for sign number idx in one layer, as a precompiled str.format """
 
-print("""
+MAPCSS_TAIL = """
 /* There's a bug in the JOSM mapcss implementation. If you have a ruleset that matches
 multiple layers like:
 
@@ -217,4 +166,84 @@ node|z-16[prop(sign, default)]::* {
     icon-image: none;
     text: none;
 }
+"""
+""" Static rules after the per-layer rules """
+
+output : List[str] = []
+
+def out(s : str):
+    """Queue a line of output.  Everything is written at once at the end."""
+    output.append(s)
+    output.append("\n")
+
+def emit_meta():
+    """Emit the meta block."""
+    out( "meta {")
+    out(f'  title: "{NAME}";')
+    out(f'  description: "{DESCRIPTION}";')
+    out(f'  version: "{VERSION}";')
+    out(f'  author: "{AUTHOR}";')
+    out(f'  icon: "{ICON}";')
+    out( '  link: "https://github.com/FIXME";')
+    out( "  watch-modified: true;")
+    out( "}\n")
+
+def emit_globals(id2url : Dict[str, str], id2aspect : Dict[str, float]):
+    """Emit the maps from sign id to icon url and to aspect ratio."""
+    quoted = ",\n".join(map('"{0[0]}", "{0[1]}"'.format, id2url.items()))
+    aspects = ",\n".join(map('"{0[0]}", {0[1]:.2}'.format, id2aspect.items()))
+    out(f"""
+globals {{
+    urls: map_build(\n{quoted}\n);
+    aspects: map_build(\n{aspects}\n)
+}}
 """)
+
+def emit_layer_rules(layer : str):
+    """Emit the rules for the MAX_SIGNS signs of one layer."""
+    transform = "prop(transformprop, default)"
+    if layer == "backward":
+        transform = "transform(rotate(0.5turn), prop(transformprop, default))"
+
+    for idx in range(MAX_SIGNS):
+        if idx == 0:
+            yoffset = "prop(real-height)"
+        else:
+            yoffset = f"prop(yoffsetprop-{layer}, {layer}{idx - 1}) + prop(real-height)"
+        out(LAYER_RULE(layer=layer, idx=idx, transform=transform, yoffset=yoffset))
+
+emit_meta()
+
+id2url : Dict[str, str] = {}
+id2aspect : Dict[str, float] = {}
+# only the maps are kept, the parsed list is freed once they are built
+for item in loads(sys.stdin.buffer.read()):
+    if "id" not in item:
+        continue
+    if len(item["urls"]) == 0:
+        continue
+    id_ = item["id"]
+    url = item["urls"][0]
+    filename = item.get("filename")
+    if filename:
+        id2url[id_] = "svgs/" + filename # url
+        id2aspect[id_] = min(item.get("height", 1.0) / item.get("width", 1.0), 1.0)
+
+# substitute empty signs for those signs that support custom text
+id2url["II.50"]   = "maxspeed-empty.svg"
+id2url["II.71"]   = "maxspeed-end-empty.svg"
+id2url["II.323a"] = "zone-maxspeed-empty.svg"
+id2url["MII.1"]   = "distance-empty.svg"
+id2url["MII.2"]   = "length-empty.svg"
+id2url["MII.3"]   = "distance-empty.svg"
+
+# meta[lang="it"] {}
+
+emit_globals(id2url, id2aspect)
+
+out(MAPCSS_HEAD)
+for layer in ("noward", "forward", "backward"):
+    emit_layer_rules(layer)
+out(MAPCSS_TAIL)
+
+sys.stdout.write("".join(output))
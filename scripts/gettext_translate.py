@@ -5,13 +5,27 @@ Translate a string using a po file.
 
 Examples:
 
-  >>> gettext_translate.py path/to/de_DE.po "Yes"
+  >>> gettext_translate.py -f path/to/de_DE.po "Yes"
   Ja
 
+Without INPUT, or with INPUT "-", reads one string per line from stdin and outputs
+tab-separated lines of language, string and translation. Every .po file is parsed only
+once, however many strings are translated:
+
+  >>> printf "Yes\\nNo\\n" | gettext_translate.py -d path/to/po
+  de      Yes     Ja
+  de      No      Nein
+  fr      Yes     Oui
+  ...
+
 """
 
 import argparse
+import functools
 import os
+import re
+import sys
+from typing import Dict
 
 args = argparse.Namespace()
 
@@ -41,7 +55,7 @@ def build_parser(description: str) -> argparse.ArgumentParser:
     )
 
     parser.add_argument(
-        "-f"
+        "-f",
         "--file",
         metavar="FILE",
         help="The .po file",
@@ -51,46 +65,71 @@ def build_parser(description: str) -> argparse.ArgumentParser:
     parser.add_argument(
         "input",
         metavar="INPUT",
-        help="The string to translate",
+        nargs="?",
+        help="The string to translate. Default: read strings from stdin",
         default=None,
     )
 
     return parser
 
 
-def unquote(line):
-    line = line.strip()
-    line = line.strip("\"")
-    return line
+STRING = r'"(?:[^"\\\n]|\\.)*"'
+""" A quoted string in a .po file """
+
+ENTRY_RE = re.compile(
+    rf'^(?:msgctxt\s+(?P<ctxt>(?:{STRING}\s*)+))?'
+    rf'msgid\s+(?P<id>(?:{STRING}\s*)+)'
+    rf'(?:msgid_plural\s+(?:{STRING}\s*)+)?'
+    rf'msgstr(?:\[0\])?\s+(?P<str>(?:{STRING}\s*)+)',
+    re.MULTILINE
+)
+""" A message in a .po file. For plurals only the singular is matched. """
+
+STRING_RE = re.compile(STRING)
+ESCAPE_RE = re.compile(r"\\(.)")
+ESCAPES = { "n" : "\n", "t" : "\t" }
+
+
+def unquote(strings : str) -> str:
+    """ Join and unescape a sequence of quoted strings. """
+    s = "".join(m.group(0)[1:-1] for m in STRING_RE.finditer(strings))
+    return ESCAPE_RE.sub(lambda m: ESCAPES.get(m.group(1), m.group(1)), s)
+
 
+@functools.lru_cache(maxsize=None)
+def read_po(pofile : str) -> Dict[str, str]:
+    """ Read all translations in a po file.
 
-def parse_po(pofile):
-    """ Scan a single po file for the translation. """
+    The header entry is skipped.  Messages without context take precedence, a message
+    with context is used only if there is no context-free message with the same msgid.
+    """
 
-    msgid = ""
-    msgstr = ""
-    mode = ""
-    with open(pofile, "r") as fp:
-        for line in fp:
-            if line.startswith("msgid "):
-                if msgid == args.input:
-                    return msgstr
-                line = line[6:]
-                mode ="id"
-                msgid = ""
-            if line.startswith("msgstr "):
-                line = line[7:]
-                mode = "str"
-                msgstr = ""
+    with open(pofile, "r", encoding="utf-8") as fp:
+        text = fp.read()
 
-            if mode == "id":
-                msgid += unquote(line)
-            if mode == "str":
-                msgstr += unquote(line)
+    messages = {}
+    with_ctxt = []
+    for m in ENTRY_RE.finditer(text):
+        msgid = unquote(m.group("id"))
+        if msgid == "":
+            continue
+        if m.group("ctxt") is None:
+            messages[msgid] = unquote(m.group("str"))
+        else:
+            with_ctxt.append((msgid, m.group("str")))
+    for msgid, msgstr in with_ctxt:
+        messages.setdefault(msgid, unquote(msgstr))
+    return messages
 
-        if msgid == args.input:
-            return msgstr
-        return None
+
+def parse_po(pofile, msgid):
+    """ Look up the translation in a single po file. """
+    return read_po(pofile).get(msgid)
+
+
+def tsv_escape(s : str) -> str:
+    """ Escape a field for tab-separated output. """
+    return s.replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n")
 
 
 def main() -> None:  # noqa: C901
@@ -100,15 +139,31 @@ def main() -> None:  # noqa: C901
     parser.parse_args(namespace=args)
 
     if args.dir:
-        for file in os.listdir(args.dir):
-            if file.endswith(".po"):
-                if msg := parse_po(os.path.join(args.dir, file)):
-                    print(file, msg)
+        pofiles = [
+            os.path.join(args.dir, file) for file in os.listdir(args.dir) if file.endswith(".po")
+        ]
     elif args.file:
-        if msg := parse_po(args.file):
-            print(msg)
+        pofiles = [args.file]
     else:
         parser.print_usage()
+        return
+
+    if args.input is None or args.input == "-":
+        for line in sys.stdin:
+            msgid = line.rstrip("\n")
+            if msgid == "":
+                continue
+            for pofile in pofiles:
+                if msg := parse_po(pofile, msgid):
+                    lang = os.path.splitext(os.path.basename(pofile))[0]
+                    print(f"{lang}\t{tsv_escape(msgid)}\t{tsv_escape(msg)}")
+    elif args.dir:
+        for pofile in pofiles:
+            if msg := parse_po(pofile, args.input):
+                print(os.path.basename(pofile), msg)
+    else:
+        if msg := parse_po(args.file, args.input):
+            print(msg)
 
 
 if __name__ == "__main__":
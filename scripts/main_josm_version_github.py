@@ -15,13 +15,23 @@ shallow git clone whose log might not reach back far enough.
 Examples:
 
   main_josm_version_github.py MarcelloPerathoner/josm >> $GITHUB_ENV
+  main_josm_version_github.py --cache .josm-version MarcelloPerathoner/josm >> $GITHUB_ENV
 
 """
 
 import argparse
+import os.path
 import re
-import requests
 import sys
+import urllib.error
+import urllib.parse
+import urllib.request
+from typing import Optional, Tuple
+
+try:
+    from orjson import loads
+except ImportError:
+    from json import loads
 
 REGEX = re.compile(r"git-svn-id:.*?trunk@(\d+)")
 
@@ -51,6 +61,13 @@ def build_parser(description: str) -> argparse.ArgumentParser:
         default="",
     )
 
+    parser.add_argument(
+        "--cache",
+        metavar="FILE",
+        help="Cache the result in this file and revalidate it with the ETag",
+        default=None,
+    )
+
     parser.add_argument(
         "repo",
         metavar="OWNER/REPO",
@@ -64,6 +81,57 @@ def out(s : str):
     sys.stdout.write(s)
 
 
+def fetch_latest_svn_rev(repo : str, cache : Optional[str] = None) -> Optional[Tuple[str, str]]:
+    """Return the most recent svn revision and its commit date found in repo.
+
+    Returns None if none of the commits returned by the API has a git-svn-id.
+
+    If a cache file is given, the result is stored there together with the ETag of
+    the response.  The next call sends a conditional request and uses the cached
+    result if GitHub answers 304 Not Modified.
+    """
+    headers = {
+        "Accept" : "application/vnd.github+json",
+        "User-Agent" : "main_josm_version_github.py",
+    }
+    cached = None
+    if cache and os.path.exists(cache):
+        with open(cache, "r") as fp:
+            cached = fp.read().splitlines()
+        if len(cached) == 3:
+            headers["If-None-Match"] = cached[0]
+        else:
+            cached = None
+
+    query = urllib.parse.urlencode({ "per_page" : 30 })
+    request = urllib.request.Request(
+        f"https://api.github.com/repos/{repo}/commits?{query}",
+        headers=headers,
+    )
+    try:
+        with urllib.request.urlopen(request, timeout=60) as r:
+            content = r.read()
+            etag = r.headers.get("ETag")
+    except urllib.error.HTTPError as e:
+        if e.code == 304 and cached:
+            return cached[1], cached[2]
+        raise
+
+    # no commit can match if there is no svn id at all: skip the parse
+    if b"git-svn-id:" not in content:
+        return None
+
+    for commit in loads(content):
+        m = REGEX.search(commit["commit"]["message"])
+        if m:
+            rev, date = m.group(1), commit["commit"]["author"]["date"]
+            if cache and etag:
+                with open(cache, "w") as fp:
+                    fp.write(f"{etag}\n{rev}\n{date}\n")
+            return rev, date
+    return None
+
+
 def main() -> None:  # noqa: C901
     """Run this."""
 
@@ -77,17 +145,14 @@ def main() -> None:  # noqa: C901
     if args.suffix != "":
         args.suffix = "-" + args.suffix
 
-    r = requests.get(f"https://api.github.com/repos/{args.repo}/commits")
-
-    for commit in r.json():
-        m = REGEX.search(commit["commit"]["message"])
-        if m:
-            out(f"MAIN_JOSM_VERSION={m.group(1)}\n")
-            date = commit["commit"]["author"]["date"]
-            out(f"MAIN_JOSM_DATE={date}\n")
-            sys.exit(0)
+    found = fetch_latest_svn_rev(args.repo, args.cache)
+    if found is None:
+        sys.exit(1)
 
-    sys.exit(1)
+    rev, date = found
+    out(f"MAIN_JOSM_VERSION={rev}\n")
+    out(f"MAIN_JOSM_DATE={date}\n")
+    sys.exit(0)
 
 
 if __name__ == "__main__":
@@ -14,15 +14,20 @@ Examples:
 
 import argparse
 import base64
+from concurrent.futures import ThreadPoolExecutor
 import fnmatch
 import glob
 import io
 import os.path
+import re
 import sys
 from urllib.parse import urljoin
 import zipfile
 
 
+MAX_WORKERS = 8
+""" how many jars to scan in parallel """
+
 args = argparse.Namespace()
 
 def build_parser(description: str) -> argparse.ArgumentParser:
@@ -89,7 +94,7 @@ def out(s : str):
 def b64_icon(archive, bname: bytes) -> bytes:
     """Base-64-encode the plugin icon"""
 
-    mimetype = ""
+    mimetype = b""
     name = bname.strip().decode("UTF-8")
     if name.endswith(".svg"):
         mimetype = b"image/svg+xml"
@@ -100,14 +105,19 @@ def b64_icon(archive, bname: bytes) -> bytes:
     if name.endswith(".jpeg"):
         mimetype = b"image/jpeg"
 
-    icon = archive.open(name).read()
-    return b"data:" + mimetype + b";base64," + base64.b64encode(icon)
+    with archive.open(name) as fp:
+        icon = fp.read()
+    return b"".join((b"data:", mimetype, b";base64,", base64.b64encode(icon)))
 
 
-def scan_jar(filename : str):
-    archive = zipfile.ZipFile(filename, 'r')
+def scan_jar(filename : str) -> str:
+    """Return the manifest of the plugin jar, one main attribute per line"""
     output = []
-    with archive.open('META-INF/MANIFEST.MF') as manifest:
+    with zipfile.ZipFile(filename, 'r') as archive:
+        # the manifest is small: read it in one go and split it in C instead of
+        # reading it line by line from the decompressor
+        manifest = archive.read('META-INF/MANIFEST.MF')
+
         # this is almost too ridiculous for telling but Sun/Oracle decided to wrap
         # manifest lines after 72 *BYTES* not *CHARACTERS* so that if a multi-byte UTF-8
         # characters happens to start at pos. 71, we end up with the two halves of an
@@ -115,15 +125,26 @@ def scan_jar(filename : str):
         #
         # We must be careful to do all our fiddling with bytes until the lines are
         # re-joined.
-        for line in manifest:
+        for line in manifest.splitlines():
             if line.startswith(b" "):
-                output.append(line[1:].rstrip(b"\r\n"))
+                output.append(line[1:])
             elif line.startswith(b"Plugin-Icon:") and args.icons:
                 output.append(b"\n\tPlugin-Icon: " + b64_icon(archive, line[12:]))
             else:
-                output.append(b"\n\t" + line.rstrip(b"\r\n"))
+                output.append(b"\n\t" + line)
+
+    return b"".join(output).decode("UTF-8")
 
-    out(b"".join(output).decode("UTF-8"))
+
+def manifest_entry(rel_path : str) -> str:
+    """Return the complete manifest entry for one plugin jar"""
+    # rel_path is relative to root_dir
+    basename = os.path.basename(rel_path)
+    return (
+        basename + ";" + urljoin(args.base_url, rel_path)
+        + scan_jar(os.path.join(args.root_dir, rel_path))
+        + "\n"
+    )
 
 
 def main() -> None:  # noqa: C901
@@ -135,16 +156,20 @@ def main() -> None:  # noqa: C901
         parser.print_usage()
         sys.exit()
 
+    # one regex for all exclude globs, compiled once
+    exclude_re = re.compile("|".join(fnmatch.translate(exclude) for exclude in args.exclude))
+
+    rel_paths = []
     for g in args.globs:
         for rel_path in glob.glob(g, root_dir=args.root_dir, recursive=True):
-            # rel_path is relative to root_dir
             basename = os.path.basename(rel_path)
-            if any(fnmatch.fnmatch(basename, exclude) for exclude in args.exclude):
+            if args.exclude and exclude_re.match(basename):
                 continue
+            rel_paths.append(rel_path)
 
-            out(basename + ";" + urljoin(args.base_url, rel_path))
-            scan_jar(os.path.join(args.root_dir, rel_path))
-            out("\n")
+    # reading the jars is i/o bound, output is still written in glob order
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        out("".join(executor.map(manifest_entry, rel_paths)))
 
 
 if __name__ == "__main__":